@@ -4,16 +4,71 @@ No external MCP SDK dependencies - implements protocol directly.
 """
 
 import os
+import re
 import json
+import time
 import uuid
+import hashlib
 import asyncio
-from typing import Dict, Any, Optional, List
+from decimal import Decimal
+from contextlib import asynccontextmanager
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, Any, Optional, List, Tuple
 from fastapi import FastAPI, Request, Response, Header
 from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import asyncpg
+import orjson
+from cachetools import TTLCache
 
-app = FastAPI(title="Indian Analytics MCP Server")
+def json_default(obj: Any) -> Any:
+    """Encode the Postgres values the JSON encoder does not handle natively.
+    
+    Kept in step with indian_analytics_mcp.json_default (this server avoids
+    importing the MCP SDK), so both servers encode NUMERIC columns alike.
+    """
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (bytes, memoryview)):
+        return obj.hex()
+    return str(obj)
+
+
+# datetime/date/time/UUID are encoded natively by orjson
+def to_json(obj: Any) -> str:
+    """Serialize to compact JSON."""
+    return orjson.dumps(obj, default=json_default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+def ndjson_line(obj: Any) -> bytes:
+    """Encode one NDJSON line."""
+    return orjson.dumps(obj, default=json_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+
+
+class DefaultJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson, including Postgres types such as Decimal."""
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load datasets and open pools on startup; close pools on shutdown."""
+    load_datasets_from_env()
+    render_static_responses()
+    await init_db_pools()
+    try:
+        yield
+    finally:
+        await asyncio.gather(*(pool.close() for pool in db_pools.values()))
+
+
+app = FastAPI(
+    title="Indian Analytics MCP Server",
+    default_response_class=DefaultJSONResponse,
+    lifespan=lifespan
+)
 
 # Add CORS middleware
 app.add_middleware(
@@ -25,15 +80,77 @@ app.add_middleware(
 )
 
 # Global state
-sessions: Dict[str, Dict[str, Any]] = {}
+# Bounded so abandoned sessions expire instead of accumulating forever
+sessions: TTLCache = TTLCache(
+    maxsize=int(os.environ.get("MCP_MAX_SESSIONS", "10000")),
+    ttl=int(os.environ.get("MCP_SESSION_TTL", "3600"))
+)
 db_pools: Dict[int, asyncpg.Pool] = {}
 DATASETS: Dict[int, Dict[str, Any]] = {}
+_schema_cache: Dict[Tuple[int, int], Tuple[float, str]] = {}  # (dataset_id, level) -> (built_at, markdown)
+
+# Responses that only depend on DATASETS, rendered once in startup()
+_CACHED_LIST_DATASETS_JSON = "❌ No datasets configured"
+_CACHED_LEVEL1_MD = "❌ No datasets configured"
+_STATIC_RESPONSES: Dict[str, Tuple[bytes, Dict[str, str]]] = {}  # path -> (body, headers incl. ETag)
 
 # Constants
 MCP_PROTOCOL_VERSION = "2025-06-18"
 CHARACTER_LIMIT = 25000
 RAW_DATA_LIMIT = 5
 AGGREGATED_LIMIT = 1000
+SCHEMA_CACHE_TTL = 300  # Seconds to reuse rendered level 2/3 context
+MAX_MCP_BODY = int(os.environ.get("MAX_MCP_BODY", str(1024 * 1024)))  # Bytes accepted per /mcp POST
+STREAM_PREFETCH = 64  # Rows per round-trip when streaming NDJSON results
+
+# Connection pool sizing (per dataset; DATASET_{id}_POOL_MAX overrides POOL_MAX)
+POOL_MIN = int(os.environ.get("POOL_MIN", "5"))
+POOL_MAX = int(os.environ.get("POOL_MAX", "25"))
+POOL_INACTIVE = float(os.environ.get("POOL_INACTIVE", "300"))  # Seconds before idle connections close
+
+# Query validation
+DANGEROUS_KEYWORDS = frozenset({"drop", "delete", "update", "insert", "alter", "create", "truncate"})
+# Only the bare-word alternative is captured; literals/comments match with an empty group
+_SQL_TOKEN_RE = re.compile(
+    r"'(?:[^']|'')*'"           # string literal
+    r'|"(?:[^"]|"")*"'          # quoted identifier
+    r"|--[^\n]*"                # line comment
+    r"|/\*.*?\*/"               # block comment
+    r"|([A-Za-z_][A-Za-z0-9_$]*)",
+    re.DOTALL
+)
+
+# Table names from DATASET_{id}_DICTIONARY are interpolated into SQL, so only
+# plain identifiers are accepted
+_TABLE_NAME_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+# Level 0 context: global rules, independent of configured datasets
+_CACHED_LEVEL0_MD = """# Indian Consumer Analytics MCP - Global Rules
+
+## Data Overview
+- **Population**: Representative sample of Indian smartphone users
+- **Active users**: 100K mobile, ~1K CTV
+- **Total users**: ~500K
+- **Update frequency**: Monthly
+
+## Automatic Transformations
+
+### 1. Weighting (CRITICAL)
+- Every user has a `weights` column
+- `weights=4` means user represents 4,000 users
+- **Always use SUM(weights) for user counts**
+- **Never extrapolate events** - only extrapolate users
+
+### 2. NCCS Merging (Automatic)
+- A, A1 → A
+- B → B
+- C, D, E → C/D/E
+
+## Query Rules
+- **Raw data**: Limited to 5 rows
+- **Aggregated**: Up to 1,000 rows
+- **Always include**: WHERE clauses for filtering
+"""
 
 # NCCS Mapping
 NCCS_MERGE_MAP = {
@@ -50,45 +167,106 @@ def load_datasets_from_env():
         if name_key not in os.environ:
             break
         
+        dictionary = json.loads(os.environ.get(f"DATASET_{dataset_id}_DICTIONARY", "{}"))
+        for table in dictionary:
+            if not _TABLE_NAME_RE.fullmatch(table):
+                raise ValueError(f"DATASET_{dataset_id}_DICTIONARY: invalid table name {table!r}")
+        
         DATASETS[dataset_id] = {
             "id": dataset_id,
             "name": os.environ[name_key],
             "description": os.environ.get(f"DATASET_{dataset_id}_DESC", ""),
             "connection": os.environ[f"DATASET_{dataset_id}_CONNECTION"],
-            "dictionary": json.loads(os.environ.get(f"DATASET_{dataset_id}_DICTIONARY", "{}"))
+            "dictionary": dictionary,
+            "pool_max": int(os.environ.get(f"DATASET_{dataset_id}_POOL_MAX", POOL_MAX)),
+            # Level 3 sample queries, built once per validated table name
+            "sample_sql": {table: f'SELECT * FROM "{table}" LIMIT 3' for table in dictionary}
         }
         dataset_id += 1
 
 
-async def init_db_pools():
-    """Initialize database connection pools."""
+def render_static_responses():
+    """Pre-render the responses derived only from DATASETS."""
+    global _CACHED_LIST_DATASETS_JSON, _CACHED_LEVEL1_MD
+    
+    datasets = [
+        {
+            "id": ds_id,
+            "name": ds_info["name"],
+            "description": ds_info["description"],
+            "tables": list(ds_info.get("dictionary", {}).keys())
+        }
+        for ds_id, ds_info in DATASETS.items()
+    ]
+    datasets_json = to_json({"datasets": datasets})
+    health_json = to_json({
+        "status": "ok",
+        "service": "Indian Analytics MCP Server",
+        "datasets": len(DATASETS),
+        "version": "1.0",
+        "mcp_endpoint": "/mcp",
+        "mcp_protocol_version": MCP_PROTOCOL_VERSION
+    })
+    # Health probes revalidate every time; dataset listings may be reused briefly
+    for path, body, cache_control in (
+        ("/", health_json, "no-cache"),
+        ("/datasets", datasets_json, "max-age=60"),
+    ):
+        data = body.encode()
+        etag = f'"{hashlib.md5(data).hexdigest()[:16]}"'
+        _STATIC_RESPONSES[path] = (data, {"ETag": etag, "Cache-Control": cache_control})
+    
+    if not DATASETS:
+        _CACHED_LIST_DATASETS_JSON = _CACHED_LEVEL1_MD = "❌ No datasets configured"
+        return
+    
+    _CACHED_LIST_DATASETS_JSON = datasets_json
+    
+    lines = ["# Available Datasets\n"]
     for ds_id, ds_info in DATASETS.items():
-        db_pools[ds_id] = await asyncpg.create_pool(
+        lines.append(f"## Dataset {ds_id}: {ds_info['name']}")
+        lines.append(f"{ds_info['description']}\n")
+        if ds_info['dictionary']:
+            lines.append("**Tables:**")
+            for table, desc in ds_info['dictionary'].items():
+                lines.append(f"- `{table}`: {desc}")
+            lines.append("")
+    _CACHED_LEVEL1_MD = "\n".join(lines)
+
+
+async def init_db_pools():
+    """Initialize database connection pools concurrently."""
+    pools = await asyncio.gather(*(
+        asyncpg.create_pool(
             ds_info["connection"],
-            min_size=2,
-            max_size=10,
+            min_size=min(POOL_MIN, ds_info["pool_max"]),
+            max_size=ds_info["pool_max"],
+            max_inactive_connection_lifetime=POOL_INACTIVE,
+            # Arbitrary user SQL: no per-connection plan cache, so a query never
+            # gets stuck on a generic plan chosen for an earlier execution
+            statement_cache_size=0,
+            max_cached_statement_lifetime=0,
             command_timeout=60
         )
-
-
-@app.on_event("startup")
-async def startup():
-    """Initialize on startup."""
-    load_datasets_from_env()
-    await init_db_pools()
-
-
-@app.on_event("shutdown")
-async def shutdown():
-    """Cleanup on shutdown."""
-    for pool in db_pools.values():
-        await pool.close()
+        for ds_info in DATASETS.values()
+    ))
+    db_pools.update(zip(DATASETS, pools))
 
 
 # ============================================================================
 # MCP TOOL IMPLEMENTATIONS
 # ============================================================================
 
+def sql_words(query: str) -> List[str]:
+    """Split SQL into lowercased bare words (keywords/identifiers).
+    
+    String literals, quoted identifiers and comments are consumed but not
+    returned, so `WHERE note = 'drop'` or a column named `update_ts` are not
+    mistaken for keywords.
+    """
+    return [word.lower() for word in _SQL_TOKEN_RE.findall(query) if word]
+
+
 async def tool_get_context(arguments: Dict[str, Any]) -> str:
     """Get progressive context about datasets."""
     level = arguments.get("level", 0)
@@ -97,110 +275,78 @@ async def tool_get_context(arguments: Dict[str, Any]) -> str:
     if level in [2, 3] and dataset_id is None:
         return "❌ Error: dataset_id required for levels 2-3"
     
-    # Level 0: Global rules
+    # Level 0/1 are static after startup
     if level == 0:
-        return """# Indian Consumer Analytics MCP - Global Rules
-
-## Data Overview
-- **Population**: Representative sample of Indian smartphone users
-- **Active users**: 100K mobile, ~1K CTV
-- **Total users**: ~500K
-- **Update frequency**: Monthly
-
-## Automatic Transformations
-
-### 1. Weighting (CRITICAL)
-- Every user has a `weights` column
-- `weights=4` means user represents 4,000 users
-- **Always use SUM(weights) for user counts**
-- **Never extrapolate events** - only extrapolate users
-
-### 2. NCCS Merging (Automatic)
-- A, A1 → A
-- B → B
-- C, D, E → C/D/E
-
-## Query Rules
-- **Raw data**: Limited to 5 rows
-- **Aggregated**: Up to 1,000 rows
-- **Always include**: WHERE clauses for filtering
-"""
+        return _CACHED_LEVEL0_MD
     
-    # Level 1: Dataset list
     if level == 1:
-        if not DATASETS:
-            return "❌ No datasets configured"
-        
-        lines = ["# Available Datasets\n"]
-        for ds_id, ds_info in DATASETS.items():
-            lines.append(f"## Dataset {ds_id}: {ds_info['name']}")
-            lines.append(f"{ds_info['description']}\n")
-            if ds_info['dictionary']:
-                lines.append("**Tables:**")
-                for table, desc in ds_info['dictionary'].items():
-                    lines.append(f"- `{table}`: {desc}")
-                lines.append("")
-        
-        return "\n".join(lines)
+        return _CACHED_LEVEL1_MD
     
     # Level 2-3: Schema details
     if level >= 2:
         if dataset_id not in DATASETS:
             return f"❌ Dataset {dataset_id} not found"
         
+        cache_key = (dataset_id, level)
+        cached = _schema_cache.get(cache_key)
+        if cached and not arguments.get("refresh") and time.monotonic() - cached[0] < SCHEMA_CACHE_TTL:
+            return cached[1]
+        
         ds_info = DATASETS[dataset_id]
+        had_error = False
         pool = db_pools[dataset_id]
         
         lines = [f"# Dataset {dataset_id}: {ds_info['name']}\n"]
         lines.append(f"{ds_info['description']}\n")
         
-        # Get schema for each table
-        for table_name in ds_info.get('dictionary', {}).keys():
-            try:
-                async with pool.acquire() as conn:
-                    # Get column info
-                    columns = await conn.fetch("""
-                        SELECT column_name, data_type
-                        FROM information_schema.columns
-                        WHERE table_name = $1
-                        ORDER BY ordinal_position
-                    """, table_name)
-                    
+        table_names = list(ds_info.get('dictionary', {}).keys())
+        
+        try:
+            async with pool.acquire() as conn:
+                # Get column info for all tables in one round-trip
+                rows = await conn.fetch("""
+                    SELECT table_name, column_name, data_type
+                    FROM information_schema.columns
+                    WHERE table_name = ANY($1::text[])
+                    ORDER BY table_name, ordinal_position
+                """, table_names)
+                columns_by_table = {
+                    table: list(cols) for table, cols in groupby(rows, key=itemgetter('table_name'))
+                }
+                
+                for table_name in table_names:
                     lines.append(f"## Table: {table_name}")
                     lines.append("| Column | Type |")
                     lines.append("|--------|------|")
-                    for col in columns:
+                    for col in columns_by_table.get(table_name, []):
                         lines.append(f"| {col['column_name']} | {col['data_type']} |")
                     lines.append("")
                     
                     # Level 3: Include sample
                     if level == 3:
-                        sample = await conn.fetch(f"SELECT * FROM {table_name} LIMIT 3")
+                        try:
+                            sample = await conn.fetch(ds_info["sample_sql"][table_name])
+                        except Exception as e:
+                            had_error = True
+                            lines.append(f"Error getting sample for {table_name}: {str(e)}\n")
+                            continue
                         if sample:
                             lines.append("**Sample rows:**")
-                            lines.append(f"```json\n{json.dumps([dict(r) for r in sample], indent=2, default=str)}\n```\n")
-            
-            except Exception as e:
-                lines.append(f"Error getting schema for {table_name}: {str(e)}\n")
+                            lines.append(f"```json\n{to_json([dict(r) for r in sample])}\n```\n")
+        
+        except Exception as e:
+            had_error = True
+            lines.append(f"Error getting schema for dataset {dataset_id}: {str(e)}\n")
         
-        return "\n".join(lines)
+        result = "\n".join(lines)
+        if not had_error:
+            _schema_cache[cache_key] = (time.monotonic(), result)
+        return result
 
 
 async def tool_list_datasets(arguments: Dict[str, Any]) -> str:
     """List all available datasets."""
-    if not DATASETS:
-        return "❌ No datasets configured"
-    
-    datasets = []
-    for ds_id, ds_info in DATASETS.items():
-        datasets.append({
-            "id": ds_id,
-            "name": ds_info["name"],
-            "description": ds_info["description"],
-            "tables": list(ds_info.get("dictionary", {}).keys())
-        })
-    
-    return json.dumps({"datasets": datasets}, indent=2)
+    return _CACHED_LIST_DATASETS_JSON
 
 
 async def tool_get_dataset_schema(arguments: Dict[str, Any]) -> str:
@@ -214,53 +360,89 @@ async def tool_get_dataset_schema(arguments: Dict[str, Any]) -> str:
     return await tool_get_context({"level": 2, "dataset_id": dataset_id})
 
 
-async def tool_run_query(arguments: Dict[str, Any]) -> str:
-    """Execute a SQL query on a dataset."""
+def prepare_user_query(arguments: Dict[str, Any]) -> Tuple[Optional[str], str, int]:
+    """Validate a run_query request and wrap it in a row cap.
+    
+    Returns (error, query, limit); error is None when the query may be
+    executed, with `limit` bound as $1.
+    """
     dataset_id = arguments.get("dataset_id")
     query = arguments.get("query", "").strip()
     
     if not dataset_id or dataset_id not in DATASETS:
-        return json.dumps({"error": f"Dataset {dataset_id} not found"})
+        return f"Dataset {dataset_id} not found", query, 0
     
     if not query:
-        return json.dumps({"error": "Query is required"})
+        return "Query is required", query, 0
+    
+    # Tokenize once; literals, quoted identifiers and comments are skipped
+    words = sql_words(query)
     
     # Security: Only allow SELECT
-    if not query.lower().startswith("select"):
-        return json.dumps({"error": "Only SELECT queries are allowed"})
+    if not words or words[0] != "select":
+        return "Only SELECT queries are allowed", query, 0
     
     # Check for dangerous keywords
-    dangerous = ["drop", "delete", "update", "insert", "alter", "create", "truncate"]
-    if any(keyword in query.lower() for keyword in dangerous):
-        return json.dumps({"error": "Query contains dangerous keywords"})
+    if not DANGEROUS_KEYWORDS.isdisjoint(words):
+        return "Query contains dangerous keywords", query, 0
     
     # Apply row limit
-    has_group_by = "group by" in query.lower()
+    has_group_by = any(a == "group" and b == "by" for a, b in zip(words, words[1:]))
     limit = AGGREGATED_LIMIT if has_group_by else RAW_DATA_LIMIT
     
-    # Add LIMIT if not present
-    if "limit" not in query.lower():
-        query += f" LIMIT {limit}"
+    # Cap rows with a bound LIMIT around the whole query; a user-supplied
+    # LIMIT still applies inside the subquery. The newline keeps a trailing
+    # line comment from swallowing the closing parenthesis.
+    query = f"SELECT * FROM ({query.rstrip(';')}\n) __sub LIMIT $1"
+    
+    return None, query, limit
+
+
+async def run_query_dict(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """Execute a SQL query on a dataset and return the result payload."""
+    error, query, limit = prepare_user_query(arguments)
+    if error:
+        return {"error": error}
     
     try:
-        pool = db_pools[dataset_id]
+        pool = db_pools[arguments["dataset_id"]]
         async with pool.acquire() as conn:
-            rows = await conn.fetch(query)
+            rows = await conn.fetch(query, limit)
             
             # Convert to list of dicts
             results = [dict(row) for row in rows]
             
-            return json.dumps({
+            return {
                 "success": True,
                 "rows": results,
                 "count": len(results)
-            }, indent=2, default=str)
+            }
     
     except Exception as e:
-        return json.dumps({
+        return {
             "success": False,
             "error": str(e)
-        })
+        }
+
+
+async def tool_run_query(arguments: Dict[str, Any]) -> str:
+    """Execute a SQL query on a dataset."""
+    return to_json(await run_query_dict(arguments))
+
+
+async def stream_query_ndjson(dataset_id: int, query: str, limit: int):
+    """Yield query rows as NDJSON lines straight from a server-side cursor.
+    
+    Only one prefetch batch is held in memory at a time. A failure after
+    rows have been sent is reported as a final {"success": false, ...} line.
+    """
+    try:
+        async with db_pools[dataset_id].acquire() as conn:
+            async with conn.transaction(readonly=True):
+                async for record in conn.cursor(query, limit, prefetch=STREAM_PREFETCH):
+                    yield ndjson_line(dict(record))
+    except Exception as e:
+        yield ndjson_line({"success": False, "error": str(e)})
 
 
 # ============================================================================
@@ -285,6 +467,10 @@ TOOLS = [
                     "type": "integer",
                     "description": "Dataset ID (required for levels 2-3)",
                     "minimum": 1
+                },
+                "refresh": {
+                    "type": "boolean",
+                    "description": "Bypass the cached schema for levels 2-3 (default: false)"
                 }
             },
             "required": ["level"]
@@ -335,20 +521,30 @@ TOOLS = [
 ]
 
 
+INITIALIZE_RESULT = {
+    "protocolVersion": MCP_PROTOCOL_VERSION,
+    "capabilities": {
+        "tools": {},
+        "prompts": {},
+        "resources": {}
+    },
+    "serverInfo": {
+        "name": "Indian Analytics MCP Server",
+        "version": "1.0"
+    }
+}
+
+# Results that never change, serialized once; mcp_post splices them into the
+# JSON-RPC envelope instead of re-encoding the dicts on every handshake
+_STATIC_RESULTS_JSON: Dict[str, bytes] = {
+    "initialize": to_json(INITIALIZE_RESULT).encode(),
+    "tools/list": to_json({"tools": TOOLS}).encode()
+}
+
+
 async def handle_initialize(params: Dict[str, Any]) -> Dict[str, Any]:
     """Handle initialize request."""
-    return {
-        "protocolVersion": MCP_PROTOCOL_VERSION,
-        "capabilities": {
-            "tools": {},
-            "prompts": {},
-            "resources": {}
-        },
-        "serverInfo": {
-            "name": "Indian Analytics MCP Server",
-            "version": "1.0"
-        }
-    }
+    return INITIALIZE_RESULT
 
 
 async def handle_tools_list(params: Dict[str, Any]) -> Dict[str, Any]:
@@ -434,9 +630,29 @@ async def mcp_post(
     if mcp_protocol_version and mcp_protocol_version != MCP_PROTOCOL_VERSION:
         return Response(status_code=400, content="Unsupported protocol version")
     
+    # Reject non-JSON and oversized bodies before reading/parsing them
+    if not request.headers.get("content-type", "").startswith("application/json"):
+        return Response(status_code=415, content="Content-Type must be application/json")
+    try:
+        declared_length = int(request.headers.get("content-length", "0"))
+    except ValueError:
+        return Response(status_code=400, content="Invalid Content-Length")
+    if declared_length > MAX_MCP_BODY:
+        return Response(status_code=413, content="Request body too large")
+    
+    # Read with a running cap as well: chunked uploads carry no Content-Length
+    chunks = []
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > MAX_MCP_BODY:
+            return Response(status_code=413, content="Request body too large")
+        chunks.append(chunk)
+    body = b"".join(chunks)
+    
     # Parse JSON-RPC message
     try:
-        message = await request.json()
+        message = orjson.loads(body)
     except Exception as e:
         return Response(status_code=400, content=f"Invalid JSON: {str(e)}")
     
@@ -445,31 +661,42 @@ async def mcp_post(
         return Response(status_code=400, content="Invalid JSON-RPC message")
     
     # Handle initialization
-    is_initialize = message.get("method") == "initialize"
+    method = message.get("method")
+    is_initialize = method == "initialize"
     
     if is_initialize:
         session_id = str(uuid.uuid4())
-        sessions[session_id] = {"initialized": False}
+        session = {"initialized": False}
     else:
         session_id = mcp_session_id
-        if not session_id or session_id not in sessions:
+        session = sessions.get(session_id) if session_id else None
+        if session is None:
             return Response(status_code=400, content="Invalid or missing session ID")
+    # (Re)insert so the TTL counts from the last request, not from initialize
+    sessions[session_id] = session
+    
+    headers = {}
+    if is_initialize:
+        headers["Mcp-Session-Id"] = session_id
+    
+    # Static results: only the id needs encoding
+    # Non-string methods (lists, objects) are unhashable; they fall through to -32601
+    static_result = _STATIC_RESULTS_JSON.get(method) if isinstance(method, str) else None
+    if static_result is not None:
+        body = b'{"jsonrpc":"2.0","id":' + to_json(message.get("id")).encode() + b',"result":' + static_result + b'}'
+        return Response(content=body, media_type="application/json", headers=headers)
     
     # Handle the message
     response_data = await handle_jsonrpc_message(message)
     
     # If notification (no response)
     if response_data is None:
-        if message.get("method") == "initialized":
-            sessions[session_id]["initialized"] = True
+        if method == "initialized":
+            session["initialized"] = True
         return Response(status_code=202)
     
     # Return JSON response
-    headers = {}
-    if is_initialize:
-        headers["Mcp-Session-Id"] = session_id
-    
-    return JSONResponse(content=response_data, headers=headers)
+    return DefaultJSONResponse(content=response_data, headers=headers)
 
 
 @app.get("/mcp")
@@ -511,44 +738,58 @@ async def mcp_get(
     )
 
 
+def static_response(request: Request, path: str) -> Response:
+    """Serve a pre-rendered body, answering a matching If-None-Match with 304."""
+    body, headers = _STATIC_RESPONSES[path]
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 # REST API for backward compatibility
 @app.get("/")
-async def health_check():
+@app.get("/health")
+async def health_check(request: Request):
     """Health check endpoint."""
-    return {
-        "status": "ok",
-        "service": "Indian Analytics MCP Server",
-        "datasets": len(DATASETS),
-        "version": "1.0",
-        "mcp_endpoint": "/mcp",
-        "mcp_protocol_version": MCP_PROTOCOL_VERSION
-    }
+    return static_response(request, "/")
 
 
 @app.get("/datasets")
-async def list_datasets():
+async def list_datasets(request: Request):
     """List datasets (REST API)."""
-    datasets = []
-    for ds_id, ds_info in DATASETS.items():
-        datasets.append({
-            "id": ds_id,
-            "name": ds_info["name"],
-            "description": ds_info["description"],
-            "tables": list(ds_info.get("dictionary", {}).keys())
-        })
-    return {"datasets": datasets}
+    return static_response(request, "/datasets")
 
 
 @app.post("/query")
 async def execute_query(request: Request):
-    """Execute query (REST API)."""
-    data = await request.json()
-    result_str = await tool_run_query(data)
-    result = json.loads(result_str)
-    return result
+    """Execute query (REST API).
+    
+    Clients sending `Accept: application/x-ndjson` get one JSON object per
+    row, streamed as the rows arrive.
+    """
+    data = orjson.loads(await request.body())
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        error, query, limit = prepare_user_query(data)
+        if error:
+            return DefaultJSONResponse(status_code=400, content={"error": error})
+        return StreamingResponse(
+            stream_query_ndjson(data["dataset_id"], query, limit),
+            media_type="application/x-ndjson"
+        )
+    
+    return await run_query_dict(data)
 
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 10000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # Sessions live in process memory, so this stays a single worker
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        log_level="warning",
+        access_log=False
+    )
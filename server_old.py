@@ -23,40 +23,42 @@ from indian_analytics_mcp import mcp, DATASETS, load_datasets_from_env
 # Load environment variables
 load_datasets_from_env()
 
-# Create FastAPI app
-app = FastAPI(title="Indian Analytics MCP Server")
-
-# Enable CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 # Connection pools
 pools = {}
 
-@app.on_event("startup")
-async def startup():
-    """Initialize database connection pools."""
-    global pools
-    for ds_id, ds_info in DATASETS.items():
-        pools[ds_id] = await asyncpg.create_pool(
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open database connection pools concurrently; close them on shutdown."""
+    created = await asyncio.gather(*(
+        asyncpg.create_pool(
             ds_info["connection"],
             min_size=2,
             max_size=10,
             command_timeout=60
         )
+        for ds_info in DATASETS.values()
+    ))
+    pools.update(zip(DATASETS, created))
     print(f"✅ Initialized {len(pools)} database connection pool(s)")
+    try:
+        yield
+    finally:
+        await asyncio.gather(*(pool.close() for pool in pools.values()))
+        print("✅ Closed all database connections")
+
+
+# Create FastAPI app
+app = FastAPI(title="Indian Analytics MCP Server", lifespan=lifespan)
 
-@app.on_event("shutdown")
-async def shutdown():
-    """Close database connection pools."""
-    for pool in pools.values():
-        await pool.close()
-    print("✅ Closed all database connections")
+# Enable CORS
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
 
 @app.get("/")
 async def root():
@@ -138,5 +140,8 @@ if __name__ == "__main__":
         app,
         host="0.0.0.0",
         port=port,
-        log_level="info"
+        loop="uvloop",
+        http="httptools",
+        log_level="warning",
+        access_log=False
     )
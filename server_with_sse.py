@@ -4,42 +4,138 @@ Wraps the Indian Analytics MCP server for remote access via Claude Desktop.
 """
 
 import os
-import json
-import uuid
+from secrets import token_hex
 import asyncio
-from typing import Dict, Any, Optional
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, Awaitable, Callable, List
 from fastapi import FastAPI, Request, Response, Header
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import asyncpg
+from cachetools import TTLCache
+from sse_starlette.sse import EventSourceResponse
 
-# Import the original MCP server
-import sys
-sys.path.append('/home/ubuntu/mcp-server-deploy')
+# Import the original MCP server (sits next to this file)
 from indian_analytics_mcp import (
     get_context,
-    list_available_datasets,
     get_dataset_schema,
-    run_query,
-    DATASETS
+    query_dataset,
+    GetContextInput,
+    GetSchemaInput,
+    QueryDatasetInput,
+    DATASETS,
+    app_lifespan,
+    mcp,
+    get_pool,
+    fetch_rows,
+    prepare_user_query,
+    stream_rows,
+    to_json,
+    to_json_bytes
 )
 
-app = FastAPI(title="Indian Analytics MCP Server")
+
+class DefaultJSONResponse(JSONResponse):
+    """JSONResponse rendered through the MCP server's to_json_bytes."""
+    def render(self, content: Any) -> bytes:
+        return to_json_bytes(content)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load datasets and open the shared per-dataset pools for the process lifetime.
+    
+    Reuses the MCP server's own lifespan, so the imported tools resolve their
+    pools through get_pool() instead of connecting per request.
+    """
+    async with app_lifespan(mcp) as state:
+        app.state.mcp_state = state
+        yield
+
+
+class ProtocolVersionMiddleware:
+    """Reject /mcp requests carrying an unsupported MCP-Protocol-Version.
+    
+    Runs at the ASGI layer, so rejected requests never build a Request or
+    reach route matching. A missing header is accepted.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith("/mcp"):
+            for name, value in scope["headers"]:
+                if name == b"mcp-protocol-version":
+                    if value and value != _PROTOCOL_VERSION_BYTES:
+                        response = PlainTextResponse("Unsupported protocol version", status_code=400)
+                        await response(scope, receive, send)
+                        return
+                    break
+        await self.app(scope, receive, send)
+
+
+app = FastAPI(
+    title="Indian Analytics MCP Server",
+    default_response_class=DefaultJSONResponse,
+    lifespan=lifespan
+)
+
+# Added before CORS so CORS stays outermost and also decorates rejections
+app.add_middleware(ProtocolVersionMiddleware)
 
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    # Only what the MCP and REST endpoints use; explicit lists let preflights
+    # be answered without echoing the requested methods/headers back
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Content-Type", "Accept", "Authorization", "Mcp-Session-Id", "MCP-Protocol-Version", "Last-Event-ID"],
 )
 
-# Session storage (in-memory for simplicity)
-sessions: Dict[str, Dict[str, Any]] = {}
+@dataclass
+class Session:
+    """Per-client MCP session state."""
+    initialized: bool = False
+    cond: asyncio.Condition = field(default_factory=asyncio.Condition)
+    
+    async def mark_initialized(self):
+        """Flag the session ready and wake requests waiting on it."""
+        async with self.cond:
+            self.initialized = True
+            self.cond.notify_all()
+    
+    async def wait_initialized(self, timeout: float):
+        """Give the initialized notification up to timeout seconds to arrive.
+        
+        Callers are served either way: a client that never sends the
+        notification pays the wait once, after which the session counts as
+        initialized, as the baseline server treated every session.
+        """
+        if self.initialized:
+            return
+        async with self.cond:
+            try:
+                await asyncio.wait_for(self.cond.wait_for(lambda: self.initialized), timeout)
+            except asyncio.TimeoutError:
+                self.initialized = True
+                self.cond.notify_all()
+
+
+# Session storage (in-memory, bounded so abandoned sessions expire)
+sessions: TTLCache = TTLCache(
+    maxsize=int(os.environ.get("MCP_MAX_SESSIONS", "10000")),
+    ttl=int(os.environ.get("MCP_SESSION_TTL", "3600"))
+)
 
 # MCP Protocol Version
 MCP_PROTOCOL_VERSION = "2025-06-18"
+_PROTOCOL_VERSION_BYTES = MCP_PROTOCOL_VERSION.encode()
+SSE_PING_INTERVAL = 15  # Seconds between keepalive comments on SSE responses
+SESSION_INIT_GRACE = 2  # Seconds a tools/call waits for a racing initialized notification
 
 # Server capabilities
 SERVER_CAPABILITIES = {
@@ -118,7 +214,7 @@ TOOLS = [
 
 def create_session_id() -> str:
     """Create a new session ID."""
-    return str(uuid.uuid4())
+    return token_hex(16)
 
 
 def create_jsonrpc_response(id: Any, result: Any) -> Dict[str, Any]:
@@ -146,23 +242,31 @@ def create_jsonrpc_error(id: Any, code: int, message: str, data: Any = None) ->
     }
 
 
+INITIALIZE_RESULT = {
+    "protocolVersion": MCP_PROTOCOL_VERSION,
+    "capabilities": SERVER_CAPABILITIES,
+    "serverInfo": {
+        "name": "Indian Analytics MCP Server",
+        "version": "1.0"
+    }
+}
+TOOLS_LIST_RESULT = {"tools": TOOLS}
+
+# Pre-encoded handshake results, spliced into the envelope by mcp_post
+_STATIC_RESULTS_JSON: Dict[str, bytes] = {
+    "initialize": to_json_bytes(INITIALIZE_RESULT),
+    "tools/list": to_json_bytes(TOOLS_LIST_RESULT)
+}
+
+
 async def handle_initialize(params: Dict[str, Any]) -> Dict[str, Any]:
     """Handle initialize request."""
-    return {
-        "protocolVersion": MCP_PROTOCOL_VERSION,
-        "capabilities": SERVER_CAPABILITIES,
-        "serverInfo": {
-            "name": "Indian Analytics MCP Server",
-            "version": "1.0"
-        }
-    }
+    return INITIALIZE_RESULT
 
 
 async def handle_tools_list(params: Dict[str, Any]) -> Dict[str, Any]:
     """Handle tools/list request."""
-    return {
-        "tools": TOOLS
-    }
+    return TOOLS_LIST_RESULT
 
 
 async def handle_tools_call(params: Dict[str, Any]) -> Dict[str, Any]:
@@ -170,15 +274,18 @@ async def handle_tools_call(params: Dict[str, Any]) -> Dict[str, Any]:
     tool_name = params.get("name")
     arguments = params.get("arguments", {})
     
+    # The MCP tools take (input model, ctx). These three only forward ctx to
+    # each other and never read it, so None stands in for the FastMCP context;
+    # list_available_datasets reads the lifespan state, served here directly.
     try:
         if tool_name == "get_context":
-            result = await get_context(arguments)
+            result = await get_context(GetContextInput(**arguments), None)
         elif tool_name == "list_available_datasets":
-            result = await list_available_datasets(arguments)
+            result = app.state.mcp_state["datasets_md"]
         elif tool_name == "get_dataset_schema":
-            result = await get_dataset_schema(arguments)
+            result = await get_dataset_schema(GetSchemaInput(**arguments), None)
         elif tool_name == "run_query":
-            result = await run_query(arguments)
+            result = await query_dataset(QueryDatasetInput(**arguments), None)
         else:
             return {
                 "content": [
@@ -194,7 +301,7 @@ async def handle_tools_call(params: Dict[str, Any]) -> Dict[str, Any]:
         if isinstance(result, str):
             content_text = result
         else:
-            content_text = json.dumps(result, indent=2)
+            content_text = to_json(result)
         
         return {
             "content": [
@@ -217,98 +324,172 @@ async def handle_tools_call(params: Dict[str, Any]) -> Dict[str, Any]:
         }
 
 
+# JSON-RPC request methods -> handler(params) returning the result payload
+_METHOD_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]] = {
+    "initialize": handle_initialize,
+    "tools/list": handle_tools_list,
+    "tools/call": handle_tools_call
+}
+
+# Notifications get no response; both spellings of the initialized notification
+# mark the session ready
+_NOTIFICATIONS = frozenset({"initialized", "notifications/initialized"})
+
+
 async def handle_jsonrpc_message(message: Dict[str, Any], session_id: Optional[str] = None) -> Dict[str, Any]:
     """Handle a JSON-RPC message and return response."""
     method = message.get("method")
-    params = message.get("params", {})
-    msg_id = message.get("id")
+    if not isinstance(method, str):  # unhashable values would break the lookups
+        method = repr(method)
     
-    # Handle different methods
-    if method == "initialize":
-        result = await handle_initialize(params)
-        return create_jsonrpc_response(msg_id, result)
-    
-    elif method == "initialized":
-        # This is a notification, no response needed
+    if method in _NOTIFICATIONS:
         return None
     
-    elif method == "tools/list":
-        result = await handle_tools_list(params)
-        return create_jsonrpc_response(msg_id, result)
-    
-    elif method == "tools/call":
-        result = await handle_tools_call(params)
-        return create_jsonrpc_response(msg_id, result)
-    
-    else:
+    handler = _METHOD_HANDLERS.get(method)
+    if handler is None:
         return create_jsonrpc_error(
-            msg_id,
+            message.get("id"),
             -32601,
             f"Method not found: {method}"
         )
+    
+    result = await handler(message.get("params", {}))
+    return create_jsonrpc_response(message.get("id"), result)
 
 
-async def sse_generator(response_data: Dict[str, Any]):
-    """Generate SSE events."""
-    # Send the response as an SSE event
-    event_data = json.dumps(response_data)
-    yield f"data: {event_data}\n\n"
+async def sse_generator(pending: Awaitable[Dict[str, Any]]):
+    """Generate SSE events.
+    
+    The response is awaited inside the stream, so EventSourceResponse keeps
+    pinging the client while a long tool call runs.
+    """
+    response_data = await pending
+    # Send the response as an SSE event, already encoded for the transport
+    yield b"data: " + to_json_bytes(response_data) + b"\n\n"
 
 
 @app.get("/mcp")
 async def mcp_get(
     request: Request,
-    mcp_session_id: Optional[str] = Header(None, alias="Mcp-Session-Id"),
-    mcp_protocol_version: Optional[str] = Header(None, alias="MCP-Protocol-Version")
+    mcp_session_id: Optional[str] = Header(None, alias="Mcp-Session-Id")
 ):
     """
     Handle GET requests to open SSE stream for server-to-client communication.
     """
-    # Validate protocol version
-    if mcp_protocol_version and mcp_protocol_version != MCP_PROTOCOL_VERSION:
-        return Response(status_code=400, content="Unsupported protocol version")
-    
     # For now, return 405 as we don't need server-initiated streams
     return Response(status_code=405, content="Server-initiated streams not supported")
 
 
+async def handle_batch_element(message: Any, session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Handle one element of a JSON-RPC batch, turning malformed ones into -32600 errors."""
+    if not isinstance(message, dict) or message.get("jsonrpc") != "2.0":
+        request_id = message.get("id") if isinstance(message, dict) else None
+        return create_jsonrpc_error(request_id, -32600, "Invalid Request")
+    if message.get("method") == "initialize":
+        return create_jsonrpc_error(message.get("id"), -32600, "initialize cannot be batched")
+    return await handle_jsonrpc_message(message, session_id)
+
+
+async def handle_jsonrpc_batch(messages: List[Any], session_id: Optional[str]) -> Response:
+    """Handle a JSON-RPC batch within an existing session.
+    
+    All messages are dispatched concurrently (tool calls hit the database in
+    parallel); responses come back as one array in request order, with
+    notifications omitted. As in JSON-RPC 2.0, a malformed element gets its
+    own -32600 error instead of failing the whole batch.
+    
+    MCP 2025-06-18 dropped batching from the transport, so conforming clients
+    never send arrays; accepting them is a backwards-compatible extension for
+    clients built against 2025-03-26 and costs single-message requests nothing.
+    """
+    session = sessions.get(session_id) if session_id else None
+    if session is None:
+        return Response(status_code=400, content="Invalid or missing session ID")
+    
+    if not messages:
+        return DefaultJSONResponse(content=create_jsonrpc_error(None, -32600, "Invalid Request: empty batch"))
+    
+    # Touch the session so its TTL restarts
+    sessions[session_id] = session
+    
+    methods = [m.get("method") if isinstance(m, dict) else None for m in messages]
+    if any(isinstance(method, str) and method in _NOTIFICATIONS for method in methods):
+        await session.mark_initialized()
+    elif "tools/call" in methods:
+        await session.wait_initialized(SESSION_INIT_GRACE)
+    
+    responses = await asyncio.gather(*(handle_batch_element(m, session_id) for m in messages))
+    
+    responses = [r for r in responses if r is not None]
+    if not responses:
+        return Response(status_code=202)
+    return DefaultJSONResponse(content=responses)
+
+
 @app.post("/mcp")
 async def mcp_post(
     request: Request,
-    mcp_session_id: Optional[str] = Header(None, alias="Mcp-Session-Id"),
-    mcp_protocol_version: Optional[str] = Header(None, alias="MCP-Protocol-Version")
+    mcp_session_id: Optional[str] = Header(None, alias="Mcp-Session-Id")
 ):
     """
     Handle POST requests with JSON-RPC messages.
     Returns either JSON response or SSE stream.
     """
-    # Validate protocol version
-    if mcp_protocol_version and mcp_protocol_version != MCP_PROTOCOL_VERSION:
-        return Response(status_code=400, content="Unsupported protocol version")
-    
     # Parse JSON-RPC message
     try:
         message = await request.json()
     except Exception as e:
         return Response(status_code=400, content=f"Invalid JSON: {str(e)}")
     
+    # JSON-RPC batch: requests run concurrently and share one HTTP round-trip
+    if isinstance(message, list):
+        return await handle_jsonrpc_batch(message, mcp_session_id)
+    
     # Validate JSON-RPC format
     if not isinstance(message, dict) or message.get("jsonrpc") != "2.0":
         return Response(status_code=400, content="Invalid JSON-RPC message")
     
     # Check if this is an initialization request
-    is_initialize = message.get("method") == "initialize"
+    method = message.get("method")
+    is_initialize = method == "initialize"
     
     # Create or validate session
     if is_initialize:
         # Create new session for initialize
         session_id = create_session_id()
-        sessions[session_id] = {"initialized": False}
+        session = Session()
     else:
         # Validate existing session
         session_id = mcp_session_id
-        if not session_id or session_id not in sessions:
+        session = sessions.get(session_id) if session_id else None
+        if session is None:
             return Response(status_code=400, content="Invalid or missing session ID")
+    # Touch the session so its TTL restarts
+    sessions[session_id] = session
+    
+    # For initialize, include session ID in header
+    headers = {}
+    if is_initialize:
+        headers["Mcp-Session-Id"] = session_id
+    
+    # Only string methods can be static; the rest get -32601 from handle_jsonrpc_message
+    static_result = _STATIC_RESULTS_JSON.get(method) if isinstance(method, str) else None
+    if static_result is not None:
+        body = b'{"jsonrpc":"2.0","id":' + to_json_bytes(message.get("id")) + b',"result":' + static_result + b'}'
+        return Response(content=body, media_type="application/json", headers=headers)
+    
+    # A tool call racing ahead of the initialized notification briefly waits for it
+    if method == "tools/call":
+        await session.wait_initialized(SESSION_INIT_GRACE)
+    
+    # Tool calls can outlast proxy idle timeouts; stream them with keepalive
+    # pings when the client accepts SSE
+    if method == "tools/call" and "text/event-stream" in request.headers.get("accept", ""):
+        return EventSourceResponse(
+            sse_generator(handle_jsonrpc_message(message, session_id)),
+            ping=SSE_PING_INTERVAL,
+            headers=headers
+        )
     
     # Handle the message
     response_data = await handle_jsonrpc_message(message, session_id)
@@ -316,17 +497,12 @@ async def mcp_post(
     # If this is a notification (no response needed)
     if response_data is None:
         # Mark session as initialized if this was the initialized notification
-        if message.get("method") == "initialized":
-            sessions[session_id]["initialized"] = True
+        if method in _NOTIFICATIONS:
+            await session.mark_initialized()
         return Response(status_code=202)
     
-    # For initialize, include session ID in header
-    headers = {}
-    if is_initialize:
-        headers["Mcp-Session-Id"] = session_id
-    
     # Return JSON response (simpler than SSE for most cases)
-    return JSONResponse(
+    return DefaultJSONResponse(
         content=response_data,
         headers=headers
     )
@@ -357,7 +533,20 @@ async def list_datasets():
             "description": ds_info["description"],
             "tables": list(ds_info.get("dictionary", {}).keys())
         })
-    return {"datasets": datasets}
+    return DefaultJSONResponse(content={"datasets": datasets})
+
+
+async def ndjson_rows(pool: asyncpg.Pool, query: str, *args: Any):
+    """Encode streamed query rows as NDJSON lines.
+    
+    A failure after rows have been sent is reported as a final
+    {"error": ...} line, since the status code is already out.
+    """
+    try:
+        async for row in stream_rows(pool, query, *args):
+            yield to_json_bytes(dict(row)) + b"\n"
+    except Exception as e:
+        yield to_json_bytes({"error": str(e)}) + b"\n"
 
 
 @app.post("/query")
@@ -368,19 +557,34 @@ async def execute_query(request: Request):
     query = data.get("query")
     
     if not dataset_id or not query:
-        return JSONResponse(
+        return DefaultJSONResponse(
             status_code=400,
             content={"error": "Missing dataset_id or query"}
         )
     
+    error, capped_query, limit, _ = prepare_user_query(query)
+    if error is None and dataset_id not in DATASETS:
+        error = f"Dataset {dataset_id} not found"
+    if error:
+        return DefaultJSONResponse(status_code=400, content={"error": error})
+    
+    # Row-by-row NDJSON for clients that ask for it: nothing is buffered
+    # beyond one cursor prefetch batch
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        return StreamingResponse(
+            ndjson_rows(get_pool(dataset_id), capped_query, limit),
+            media_type="application/x-ndjson"
+        )
+    
     try:
-        result = await run_query({"dataset_id": dataset_id, "query": query})
-        # Parse the result if it's a string
-        if isinstance(result, str):
-            result = json.loads(result)
-        return result
+        rows = await fetch_rows(get_pool(dataset_id), capped_query, limit)
+        return DefaultJSONResponse(content={
+            "success": True,
+            "rows": [dict(row) for row in rows],
+            "count": len(rows)
+        })
     except Exception as e:
-        return JSONResponse(
+        return DefaultJSONResponse(
             status_code=500,
             content={"error": str(e)}
         )
@@ -389,4 +593,12 @@ async def execute_query(request: Request):
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 10000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # Sessions live in process memory, so this stays a single worker: uvicorn's
+    # workers share one socket and no proxy can pin a client to one of them
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools"
+    )